@@ -1,30 +1,76 @@
 """
 Authentication utilities for Basalt SaaS
 """
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+from datetime import timedelta
+from functools import lru_cache
 from typing import Optional
 import secrets
+import base64
+import hashlib
+import hmac
+import json
+import time
+import logging
+import bcrypt
 import jwt
 import os
 
+logger = logging.getLogger("basalt")
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes are Argon2id (memory-hard, ~tens of ms per verify at these
+# settings). bcrypt hashes from older accounts are still accepted and get
+# upgraded on the next successful login.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+ARGON2_PREFIX = "$argon2"
 
 # JWT settings
-SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_hex(32))
+# Every worker must share the same key or sessions break whenever a request
+# lands on a different worker, so production refuses to start without one.
+if os.getenv("ENV") == "prod":
+    SECRET_KEY = os.environ["SECRET_KEY"]
+else:
+    SECRET_KEY = os.getenv("SECRET_KEY")
+    if not SECRET_KEY:
+        SECRET_KEY = secrets.token_hex(32)
+        logger.warning("SECRET_KEY not set, using an ephemeral key (sessions won't survive restarts or span workers)")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24 * 7  # 7 days
 
+# Session tokens are always HS256, so they're signed/verified with one-shot
+# hmac.digest instead of going through PyJWT. The header never changes (and
+# matches what PyJWT emits), so it's encoded once here.
+_SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
+_JWT_HEADER = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+
 
 def hash_password(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    if hashed_password.startswith(ARGON2_PREFIX):
+        try:
+            return password_hasher.verify(hashed_password, plain_password)
+        except (VerificationError, InvalidHash):
+            return False
+    try:
+        # Legacy bcrypt hash; bcrypt only looks at the first 72 bytes
+        return bcrypt.checkpw(plain_password.encode("utf-8")[:72], hashed_password.encode("utf-8"))
+    except ValueError:
+        # Unsupported or malformed hash - it can't match anything
+        return False
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True if the hash is legacy (non-Argon2id) or uses outdated Argon2 parameters"""
+    if not hashed_password.startswith(ARGON2_PREFIX):
+        return True
+    return password_hasher.check_needs_rehash(hashed_password)
 
 
 def generate_api_key() -> str:
@@ -32,27 +78,84 @@ def generate_api_key() -> str:
     return f"bslt_{secrets.token_hex(24)}"
 
 
+def hash_api_key(api_key: str) -> str:
+    """Digest stored in place of an API key (keys are random, so a fast hash is enough)"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+
+def _sign(signing_input: bytes) -> bytes:
+    return _b64encode(hmac.digest(_SECRET_KEY_BYTES, signing_input, "sha256"))
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    if not expires_delta:
+        expires_delta = timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+    to_encode.update({"exp": int(time.time() + expires_delta.total_seconds())})
+    body = _b64encode(json.dumps(to_encode, separators=(",", ":")).encode("utf-8"))
+    signing_input = _JWT_HEADER + b"." + body
+    return (signing_input + b"." + _sign(signing_input)).decode("ascii")
+
+
+# Tokens revoked on logout, mapped to their expiry so they can be pruned
+_revoked_tokens = {}
+
+
+@lru_cache(maxsize=8192)
+def _verify_token(token: str) -> Optional[dict]:
+    """Verify a token's signature once; HS256 is deterministic so the result can be cached"""
+    try:
+        header, body, signature = token.encode("ascii").split(b".")
+    except (UnicodeEncodeError, ValueError):
+        return None
+    
+    if header != _JWT_HEADER:
+        # Not our fixed header - let PyJWT sort it out (and reject other algorithms)
+        try:
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
+        except jwt.InvalidTokenError:
+            return None
+    
+    if not hmac.compare_digest(_sign(header + b"." + body), signature):
+        return None
+    try:
+        payload = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or not isinstance(payload.get("exp"), (int, float)):
+        return None
+    return payload
 
 
 def decode_access_token(token: str) -> Optional[dict]:
     """Decode and verify a JWT access token"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
+    if token in _revoked_tokens:
         return None
-    except jwt.JWTError:
+    payload = _verify_token(token)
+    # A cached payload may have expired since it was first verified
+    if not payload or payload["exp"] <= time.time():
         return None
+    # The cached dict is shared by every caller, hand out a copy
+    return dict(payload)
+
+
+def revoke_access_token(token: str):
+    """Reject a token from now on (e.g. after logout)"""
+    now = time.time()
+    for expired in [t for t, exp in _revoked_tokens.items() if exp <= now]:
+        del _revoked_tokens[expired]
+    payload = _verify_token(token)
+    if payload:
+        _revoked_tokens[token] = payload["exp"]
 
 
 def get_user_from_token(token: str) -> Optional[int]:
@@ -1,10 +1,15 @@
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+import hashlib
 import json
 import os
+import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Evidence:
     """Represents the cryptographic proof returned by the Basalt Protocol."""
     ipfs_cid: str
@@ -14,14 +19,32 @@ class Evidence:
     c2pa_status: str
     
     def __str__(self):
-        return f"""
-        === BASALT EVIDENCE ===
-        [HASH]   : {self.sha256_hash}
-        [IPFS]   : {self.ipfs_cid}
-        [SOLANA] : {self.solana_tx}
-        [STATUS] : {self.c2pa_status}
-        ========================
-        """
+        return "\n".join((
+            "=== BASALT EVIDENCE ===",
+            f"[HASH]   : {self.sha256_hash}",
+            f"[IPFS]   : {self.ipfs_cid}",
+            f"[SOLANA] : {self.solana_tx}",
+            f"[STATUS] : {self.c2pa_status}",
+            "========================",
+        ))
+
+def _evidence_from_json(ev_data: Dict) -> Evidence:
+    return Evidence(
+        ipfs_cid=ev_data["ipfs_cid"],
+        ipfs_url=ev_data["ipfs_url"],
+        sha256_hash=ev_data["sha256_hash"],
+        solana_tx=ev_data["solana_tx"],
+        c2pa_status=ev_data["c2pa_verification"]
+    )
+
+def _sha256_file(f) -> str:
+    """SHA-256 of an open binary file, hashed in C without Python-level chunk loops where possible."""
+    if hasattr(hashlib, "file_digest"):  # Python 3.11+
+        return hashlib.file_digest(f, "sha256").hexdigest()
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        h.update(chunk)
+    return h.hexdigest()
 
 class BasaltClient:
     """
@@ -31,7 +54,14 @@ class BasaltClient:
     def __init__(self, api_key: str = None, base_url: str = "http://localhost:8000"):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
-        # In a real version, we would add headers={"Authorization": f"Bearer {api_key}"}
+        
+        # One session per client so connections (and TLS handshakes) are reused
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=3)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        if api_key:
+            self._session.headers["Authorization"] = f"Bearer {api_key}"
 
     def notarize(self, file_path: str, metadata: Optional[Dict] = None) -> Evidence:
         """
@@ -42,41 +72,85 @@ class BasaltClient:
         :param metadata: Optional dictionary of extra claims (e.g. location, author)
         :return: Evidence object containing proofs
         """
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Asset not found at: {file_path}")
-
         url = f"{self.base_url}/notarize"
         
-        # Prepare the file
-        with open(file_path, 'rb') as f:
-            files = {'file': f}
+        # Open directly instead of checking os.path.exists first (no extra
+        # syscall, and no window for the file to vanish in between)
+        try:
+            f = open(file_path, 'rb')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Asset not found at: {file_path}") from None
+        
+        # Prepare the file (streamed from disk, never fully loaded in memory)
+        with f:
+            file_size = os.fstat(f.fileno()).st_size
+            
+            # Skip the upload entirely if the node already holds this exact file
+            existing = self._lookup_existing(_sha256_file(f))
+            if existing:
+                return existing
+            f.seek(0)
+            
+            form = MultipartEncoder(fields={
+                'file': (os.path.basename(file_path), f, 'application/octet-stream'),
+                'file_size': str(file_size)
+            })
             
             # Send Request
             try:
                 print(f"[*] Transmitting asset to Basalt Node: {self.base_url}...")
-                response = requests.post(url, files=files)
+                response = self._session.post(url, data=form, headers={'Content-Type': form.content_type})
                 response.raise_for_status()
                 
-                data = response.json()
+                data = orjson.loads(response.content)
                 
                 if "error" in data:
                     raise Exception(f"Basalt Node Error: {data['error']}")
                 
-                ev_data = data["evidence"]
-                
-                return Evidence(
-                    ipfs_cid=ev_data["ipfs_cid"],
-                    ipfs_url=ev_data["ipfs_url"],
-                    sha256_hash=ev_data["sha256_hash"],
-                    solana_tx=ev_data["solana_tx"],
-                    c2pa_status=ev_data["c2pa_verification"]
-                )
+                return _evidence_from_json(data["evidence"])
                 
             except requests.exceptions.ConnectionError:
                 raise Exception("Could not connect to Basalt Node. Is the server running?")
             except Exception as e:
                 raise Exception(f"Notarization Failed: {str(e)}")
 
+    def _lookup_existing(self, content_hash: str) -> Optional[Evidence]:
+        """Returns the node's evidence for an already notarized file, or None."""
+        try:
+            response = self._session.get(f"{self.base_url}/exists/{content_hash}", timeout=10)
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return _evidence_from_json(orjson.loads(response.content)["evidence"])
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            # Unexpected body (e.g. an older node) - treat as a miss and upload
+            return None
+
+    def batch_notarize(
+        self,
+        paths: List[str],
+        metadata: Optional[Dict] = None,
+        max_workers: int = 8
+    ) -> List[Tuple[str, Union[Evidence, Exception]]]:
+        """
+        Notarizes several files concurrently. Uploads are network-bound,
+        so they run on a thread pool sharing this client's session.
+        
+        :param paths: Paths to the local files
+        :param metadata: Optional dictionary of extra claims applied to every file
+        :param max_workers: Maximum number of uploads in flight (keep <= the pool size of 32)
+        :return: List of (path, Evidence or Exception) in completion order
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.notarize, path, metadata): path for path in paths}
+            for future in as_completed(futures):
+                error = future.exception()
+                results.append((futures[future], error if error else future.result()))
+        return results
+
     def verify(self, evidence: Evidence) -> bool:
         """
         Verifies the validity of an Evidence object locally.
@@ -84,3 +158,7 @@ class BasaltClient:
         """
         # In a real app, this would query the blockchain to check the tx hash
         return True
+
+    def close(self):
+        """Closes the underlying HTTP session and its pooled connections."""
+        self._session.close()
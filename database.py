@@ -1,15 +1,55 @@
 """
 Database models for Basalt SaaS
 """
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Float
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Float, Index, event, inspect, text
+from sqlalchemy.dialects.postgresql import CITEXT
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import orjson
 import os
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./basalt.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+engine_options = {
+    "connect_args": {"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    # Pooled connections are checked before use and recycled before
+    # servers/proxies drop idle ones
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+    "future": True,
+    "echo": False,
+}
+if "sqlite" not in DATABASE_URL:
+    # Enough connections for concurrent requests (SQLite is single-writer, and
+    # its :memory: pool doesn't accept sizing options)
+    engine_options["pool_size"] = 20
+    engine_options["max_overflow"] = 40
+if DATABASE_URL.startswith("postgres"):
+    engine_options["query_cache_size"] = 1200
+engine = create_engine(DATABASE_URL, **engine_options)
+
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets dashboard reads proceed while a write commits, and
+        # synchronous=NORMAL only fsyncs at checkpoints instead of every commit
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        cursor.close()
+
+# Emails compare case-insensitively in the database itself, so lookups hit the
+# unique index without lowercasing in Python (Postgres needs the citext extension)
+if DATABASE_URL.startswith("postgres"):
+    EmailType = CITEXT()
+elif "sqlite" in DATABASE_URL:
+    EmailType = String(255, collation="NOCASE")
+else:
+    EmailType = String(255)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,7 +58,7 @@ class User(Base):
     __tablename__ = "users"
     
     id = Column(Integer, primary_key=True, index=True)
-    email = Column(String(255), unique=True, index=True, nullable=False)
+    email = Column(EmailType, unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     name = Column(String(255))
     company = Column(String(255))
@@ -49,7 +89,9 @@ class APIKey(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    key = Column(String(64), unique=True, index=True, nullable=False)
+    # Only a SHA-256 of the key is stored; the plaintext is shown once at creation
+    key_prefix = Column(String(12), index=True, nullable=False)
+    key_hash = Column(String(64), unique=True, index=True, nullable=False)
     name = Column(String(255), default="Default")
     
     # Permissions
@@ -90,6 +132,11 @@ class Notarization(Base):
     user = relationship("User", back_populates="notarizations")
 
 
+# Composite indexes for the dashboard queries (a user's newest assets, active keys)
+ix_notar_user_created = Index("ix_notar_user_created", Notarization.user_id, Notarization.created_at.desc())
+ix_apikey_user_active = Index("ix_apikey_user_active", APIKey.user_id, APIKey.is_active)
+
+
 # Pricing tiers configuration
 PRICING_TIERS = {
     "free": {
@@ -134,10 +181,78 @@ PRICING_TIERS = {
     },
 }
 
+# Serialized once - the tiers never change while the app is running
+PRICING_TIERS_JSON = orjson.dumps(PRICING_TIERS)
+
+
+def _migrate_api_keys():
+    """Move api_keys from the plaintext `key` column to key_prefix/key_hash"""
+    with engine.begin() as conn:
+        columns = {column["name"] for column in inspect(conn).get_columns("api_keys")}
+        if "key" not in columns:
+            return
+        
+        from auth import hash_api_key
+        conn.execute(text("ALTER TABLE api_keys ADD COLUMN key_prefix VARCHAR(12)"))
+        conn.execute(text("ALTER TABLE api_keys ADD COLUMN key_hash VARCHAR(64)"))
+        for key_id, raw_key in conn.execute(text('SELECT id, "key" FROM api_keys')).all():
+            conn.execute(
+                text("UPDATE api_keys SET key_prefix = :prefix, key_hash = :hash WHERE id = :id"),
+                {"prefix": raw_key[:12], "hash": hash_api_key(raw_key), "id": key_id}
+            )
+        conn.execute(text("DROP INDEX IF EXISTS ix_api_keys_key"))
+        conn.execute(text('ALTER TABLE api_keys DROP COLUMN "key"'))
+        for index in APIKey.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _migrate_user_emails():
+    """Switch an existing users.email column to the case-insensitive type"""
+    with engine.begin() as conn:
+        if DATABASE_URL.startswith("postgres"):
+            email = next(c for c in inspect(conn).get_columns("users") if c["name"] == "email")
+            if not isinstance(email["type"], CITEXT):
+                conn.execute(text("ALTER TABLE users ALTER COLUMN email TYPE citext"))
+            return
+        if "sqlite" not in DATABASE_URL:
+            return
+        
+        table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'users'")).scalar()
+        if "NOCASE" in table_sql.upper():
+            return
+        duplicates = conn.execute(text(
+            "SELECT lower(email) FROM users GROUP BY lower(email) HAVING count(*) > 1"
+        )).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                f"Cannot make users.email case-insensitive, these emails exist in several cases: {duplicates}"
+            )
+        
+        # SQLite can't change a column's collation in place, so rebuild the table.
+        # legacy_alter_table keeps the rename from rewriting other tables' foreign keys.
+        old_columns = {column["name"] for column in inspect(conn).get_columns("users")}
+        columns = ", ".join(c.name for c in User.__table__.columns if c.name in old_columns)
+        conn.execute(text("PRAGMA legacy_alter_table = ON"))
+        conn.execute(text("ALTER TABLE users RENAME TO users_old"))
+        for index in User.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        User.__table__.create(bind=conn)
+        conn.execute(text(f"INSERT INTO users ({columns}) SELECT {columns} FROM users_old"))
+        conn.execute(text("DROP TABLE users_old"))
+        conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+
 
 def init_db():
     """Create all database tables"""
+    if DATABASE_URL.startswith("postgres"):
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS citext"))
     Base.metadata.create_all(bind=engine)
+    _migrate_user_emails()
+    _migrate_api_keys()
+    # create_all skips tables that already exist, indexes included
+    for index in (ix_notar_user_created, ix_apikey_user_active):
+        index.create(bind=engine, checkfirst=True)
 
 
 def get_db():
@@ -5,7 +5,7 @@ This example demonstrates how to use the Basalt Python SDK to notarize
 digital assets with cryptographic provenance.
 
 Requirements:
-    pip install requests
+    pip install requests requests-toolbelt orjson
 
 Usage:
     1. Start the Basalt server: uvicorn main:app --reload
@@ -119,7 +119,7 @@ def full_example():
 # ============================================================
 
 def batch_example():
-    """Notarize multiple files in sequence."""
+    """Notarize multiple files in parallel."""
     
     from basalt_sdk import BasaltClient
     
@@ -132,20 +132,20 @@ def batch_example():
     ]
     
     results = []
-    for file_path in files_to_notarize:
-        try:
-            evidence = client.notarize(file_path)
+    for file_path, outcome in client.batch_notarize(files_to_notarize, max_workers=4):
+        if isinstance(outcome, Exception):
             results.append({
                 "file": file_path,
-                "status": "SECURED",
-                "cid": evidence.ipfs_cid
+                "status": "FAILED",
+                "error": str(outcome)
             })
-        except Exception as e:
+        else:
             results.append({
                 "file": file_path,
-                "status": "FAILED",
-                "error": str(e)
+                "status": "SECURED",
+                "cid": outcome.ipfs_cid
             })
+    client.close()
     
     # Print summary
     for r in results:
@@ -3,10 +3,12 @@ import time
 import hashlib
 import json
 import logging
+import orjson
 from typing import Optional
 
 from fastapi import FastAPI, UploadFile, File, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse
+from orjson_response import ORJSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
@@ -35,7 +37,7 @@ SOLANA_RPC = "https://api.devnet.solana.com"
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("basalt")
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -61,6 +63,17 @@ def get_solana_keypair() -> Optional[Keypair]:
 
 sender_keypair = get_solana_keypair()
 
+# Evidence already issued, keyed by SHA-256 of the original upload.
+# Lets clients (and repeat uploads) skip re-signing/re-anchoring identical files.
+# NOTE: this is a best-effort, per-process cache - it's empty after a restart
+# and not shared between uvicorn workers, so a miss only means "upload again".
+# Mock results (Pinata/Solana not configured) are never cached.
+MAX_NOTARIZED_ASSETS = 10000
+notarized_assets = {}
+
+MOCK_IPFS_CID = "Qm_MOCK_IPFS_HASH_FOR_DEMO"
+MOCK_SOLANA_TX = "5_MOCK_SOLANA_TX_SIGNATURE_FOR_DEMO"
+
 # --- HELPER FUNCTIONS ---
 
 def sign_with_c2pa(input_path, output_path, mime_type="image/jpeg"):
@@ -162,7 +175,7 @@ def upload_to_ipfs(file_path):
     """
     if not PINATA_JWT or "placeholder" in PINATA_JWT:
         logger.warning("Pinata JWT not set, mocking IPFS upload")
-        return "Qm_MOCK_IPFS_HASH_FOR_DEMO"
+        return MOCK_IPFS_CID
 
     url = "https://api.pinata.cloud/pinning/pinFileToIPFS"
     headers = {"Authorization": f"Bearer {PINATA_JWT}"}
@@ -172,7 +185,7 @@ def upload_to_ipfs(file_path):
         try:
             response = requests.post(url, files=files, headers=headers)
             response.raise_for_status()
-            return response.json()['IpfsHash']
+            return orjson.loads(response.content)['IpfsHash']
         except Exception as e:
             logger.error(f"Pinata Upload Error: {e}")
             raise Exception("IPFS Upload Failed")
@@ -184,7 +197,7 @@ def anchor_to_solana(ipfs_cid, file_hash):
     """
     if not sender_keypair:
         logger.warning("Solana Keypair not available, mocking transaction")
-        return "5_MOCK_SOLANA_TX_SIGNATURE_FOR_DEMO"
+        return MOCK_SOLANA_TX
 
     # 1. Create the Payload (The Memo)
     payload = f"BASALT:{ipfs_cid}:{file_hash}"
@@ -286,7 +299,7 @@ async def verify_asset(cid: str):
                         result["file_size"] = len(file_response.content)
                         result["gateway_used"] = ipfs_url.split('/ipfs/')[0]
                         logger.info(f"Verification SUCCESS for {cid}")
-                        return JSONResponse(result)
+                        return ORJSONResponse(result)
                     elif file_response.status_code == 429:
                         logger.warning(f"Rate limited on {ipfs_url}, trying next gateway...")
                         continue
@@ -318,7 +331,15 @@ async def verify_asset(cid: str):
         result["error"] = str(e)
         logger.error(f"Verification error: {e}")
     
-    return JSONResponse(result)
+    return ORJSONResponse(result)
+
+@app.get("/exists/{content_hash}")
+async def asset_exists(content_hash: str):
+    """Returns the evidence for a previously notarized file, looked up by its SHA-256."""
+    evidence = notarized_assets.get(content_hash.lower())
+    if not evidence:
+        return ORJSONResponse({"error": "Asset not found"}, status_code=404)
+    return ORJSONResponse({"status": "SECURED", "evidence": evidence})
 
 @app.post("/notarize")
 async def notarize(file: UploadFile = File(...)):
@@ -353,7 +374,7 @@ async def notarize(file: UploadFile = File(...)):
     
     # Check if file type is supported
     if file_ext not in SUPPORTED_TYPES:
-        return JSONResponse({
+        return ORJSONResponse({
             "error": f"Unsupported file type: {file_ext}. Supported: {', '.join(SUPPORTED_TYPES.keys())}"
         }, status_code=400)
     
@@ -367,6 +388,11 @@ async def notarize(file: UploadFile = File(...)):
     
     try:
         content = await file.read()
+        source_hash = hashlib.sha256(content).hexdigest()
+        
+        # Identical file already notarized - hand back the existing proof
+        if source_hash in notarized_assets:
+            return ORJSONResponse({"status": "SECURED", "evidence": notarized_assets[source_hash]})
         
         # For images, sanitize to ensure clean format
         if mime_type.startswith("image/"):
@@ -411,21 +437,27 @@ async def notarize(file: UploadFile = File(...)):
         # 5. Anchor to Solana (The "Timechain")
         tx_sig = anchor_to_solana(ipfs_cid, file_hash)
 
-        return JSONResponse({
+        evidence = {
+            "ipfs_cid": ipfs_cid,
+            "ipfs_url": f"https://gateway.pinata.cloud/ipfs/{ipfs_cid}",
+            "sha256_hash": file_hash,
+            "solana_tx": f"https://explorer.solana.com/tx/{tx_sig}?cluster=devnet",
+            "c2pa_verification": "ACTIVE",
+            "file_type": mime_type
+        }
+        if ipfs_cid != MOCK_IPFS_CID and tx_sig != MOCK_SOLANA_TX:
+            if len(notarized_assets) >= MAX_NOTARIZED_ASSETS:
+                notarized_assets.pop(next(iter(notarized_assets)))
+            notarized_assets[source_hash] = evidence
+
+        return ORJSONResponse({
             "status": "SECURED",
-            "evidence": {
-                "ipfs_cid": ipfs_cid,
-                "ipfs_url": f"https://gateway.pinata.cloud/ipfs/{ipfs_cid}",
-                "sha256_hash": file_hash,
-                "solana_tx": f"https://explorer.solana.com/tx/{tx_sig}?cluster=devnet",
-                "c2pa_verification": "ACTIVE",
-                "file_type": mime_type
-            }
+            "evidence": evidence
         })
         
     except Exception as e:
         logger.error(f"Error: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return ORJSONResponse({"error": str(e)}, status_code=500)
     finally:
         # Cleanup
         if os.path.exists(temp_filename):
@@ -0,0 +1,14 @@
+"""
+orjson-backed JSON response for Basalt SaaS
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (FastAPI's own ORJSONResponse is deprecated)"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -2,16 +2,59 @@
 Authentication and Dashboard Routes for Basalt SaaS
 Add these routes to main.py or import this module
 """
-from fastapi import APIRouter, Request, Form, Depends, HTTPException, Response
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+import os
+import time
+
+from fastapi import APIRouter, BackgroundTasks, Request, Form, Depends, HTTPException, Response
+from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.templating import Jinja2Templates
+from sqlalchemy import case, func, update
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
 
-from database import get_db, User, APIKey, Notarization, PRICING_TIERS, init_db
-from auth import hash_password, verify_password, create_access_token, decode_access_token, generate_api_key
-
-router = APIRouter()
+from orjson_response import ORJSONResponse
+from database import get_db, SessionLocal, User, APIKey, Notarization, PRICING_TIERS, PRICING_TIERS_JSON, init_db
+from auth import (
+    hash_password, verify_password, password_needs_rehash, create_access_token, decode_access_token,
+    revoke_access_token, generate_api_key, hash_api_key
+)
+
+logger = logging.getLogger("basalt")
+
+# Optional Redis for API key usage counters (flushed to the DB in batches).
+# Without REDIS_URL usage is written straight to the DB after each response.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    import redis
+    redis_client = redis.Redis.from_url(REDIS_URL)
+else:
+    redis_client = None
+API_KEY_USAGE_FLUSH_SECONDS = 30
+API_KEY_TOUCHED_SET = "apikey:touched"
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Flush Redis usage counters periodically while the app runs, and once on shutdown"""
+    if not redis_client:
+        yield
+        return
+    flusher = asyncio.create_task(_flush_api_key_usage_periodically())
+    try:
+        yield
+    finally:
+        flusher.cancel()
+        await asyncio.to_thread(flush_api_key_usage)
+
+
+router = APIRouter(lifespan=lifespan)
+templates = Jinja2Templates(directory="templates")
+# Templates don't change under a production deploy, skip the mtime check per render
+templates.env.auto_reload = os.getenv("ENV") != "prod"
 
 # Initialize database on import
 init_db()
@@ -19,19 +62,18 @@ init_db()
 
 def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
     """Get current user from session cookie"""
-    token = request.cookies.get("session")
-    if not token:
-        return None
-    
-    payload = decode_access_token(token)
-    if not payload:
-        return None
+    # Already resolved earlier in this request
+    if hasattr(request.state, "user"):
+        return request.state.user
     
-    user_id = payload.get("user_id")
-    if not user_id:
-        return None
+    user = None
+    token = request.cookies.get("session")
+    payload = decode_access_token(token) if token else None
+    user_id = payload.get("user_id") if payload else None
+    if user_id:
+        user = db.query(User).filter(User.id == user_id).first()
     
-    user = db.query(User).filter(User.id == user_id).first()
+    request.state.user = user
     return user
 
 
@@ -49,8 +91,6 @@ def require_auth(request: Request, db: Session = Depends(get_db)) -> User:
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
     return templates.TemplateResponse("login.html", {"request": request})
 
 
@@ -61,17 +101,19 @@ async def login_submit(
     password: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
+    user = db.query(User).filter(User.email == email).first()
     
-    user = db.query(User).filter(User.email == email.lower()).first()
-    
-    if not user or not verify_password(password, user.password_hash):
+    # Password hashing is slow on purpose - run it off the event loop
+    if not user or not await asyncio.to_thread(verify_password, password, user.password_hash):
         return templates.TemplateResponse("login.html", {
             "request": request,
             "error": "Invalid email or password"
         })
     
+    # Upgrade legacy/outdated hashes while we have the plaintext
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await asyncio.to_thread(hash_password, password)
+    
     # Update last login
     user.last_login = datetime.utcnow()
     db.commit()
@@ -92,8 +134,6 @@ async def login_submit(
 
 @router.get("/signup", response_class=HTMLResponse)
 async def signup_page(request: Request):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
     return templates.TemplateResponse("signup.html", {"request": request})
 
 
@@ -106,11 +146,8 @@ async def signup_submit(
     company: str = Form(None),
     db: Session = Depends(get_db)
 ):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
-    
     # Check if user exists
-    existing = db.query(User).filter(User.email == email.lower()).first()
+    existing = db.query(User).filter(User.email == email).first()
     if existing:
         return templates.TemplateResponse("signup.html", {
             "request": request,
@@ -125,9 +162,10 @@ async def signup_submit(
         })
     
     # Create user
+    password_hash = await asyncio.to_thread(hash_password, password)
     user = User(
         email=email.lower(),
-        password_hash=hash_password(password),
+        password_hash=password_hash,
         name=name,
         company=company,
         tier="free",
@@ -154,7 +192,11 @@ async def signup_submit(
 
 
 @router.get("/logout")
-async def logout():
+async def logout(request: Request):
+    token = request.cookies.get("session")
+    if token:
+        revoke_access_token(token)
+    
     response = RedirectResponse(url="/", status_code=303)
     response.delete_cookie("session")
     return response
@@ -166,9 +208,6 @@ async def logout():
 
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, db: Session = Depends(get_db)):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
-    
     user = get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
@@ -181,10 +220,12 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
     
     # Get user's data
     api_keys = db.query(APIKey).filter(APIKey.user_id == user.id, APIKey.is_active == True).all()
-    recent_assets = db.query(Notarization).filter(
+    # Recent assets and the user's total in one round-trip (window count runs before LIMIT)
+    rows = db.query(Notarization, func.count().over().label("total")).filter(
         Notarization.user_id == user.id
     ).order_by(Notarization.created_at.desc()).limit(10).all()
-    total_assets = db.query(Notarization).filter(Notarization.user_id == user.id).count()
+    recent_assets = [row[0] for row in rows]
+    total_assets = rows[0][1] if rows else 0
     
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
@@ -197,9 +238,6 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
 
 @router.get("/dashboard/assets", response_class=HTMLResponse)
 async def dashboard_assets(request: Request, db: Session = Depends(get_db)):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
-    
     user = get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
@@ -228,24 +266,26 @@ async def create_api_key(
 ):
     user = get_current_user(request, db)
     if not user:
-        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+        return ORJSONResponse({"error": "Unauthorized"}, status_code=401)
     
     if user.tier == "free":
-        return JSONResponse({"error": "Upgrade to Pro for API access"}, status_code=403)
+        return ORJSONResponse({"error": "Upgrade to Pro for API access"}, status_code=403)
     
-    # Generate new API key
+    # Generate new API key (the plaintext is only ever returned here)
+    raw_key = generate_api_key()
     key = APIKey(
         user_id=user.id,
-        key=generate_api_key(),
+        key_prefix=raw_key[:12],
+        key_hash=hash_api_key(raw_key),
         name=name
     )
     db.add(key)
     db.commit()
     db.refresh(key)
     
-    return JSONResponse({
+    return ORJSONResponse({
         "message": "API key created",
-        "key": key.key,
+        "key": raw_key,
         "name": key.name
     })
 
@@ -258,16 +298,16 @@ async def delete_api_key(
 ):
     user = get_current_user(request, db)
     if not user:
-        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+        return ORJSONResponse({"error": "Unauthorized"}, status_code=401)
     
     key = db.query(APIKey).filter(APIKey.id == key_id, APIKey.user_id == user.id).first()
     if not key:
-        return JSONResponse({"error": "Key not found"}, status_code=404)
+        return ORJSONResponse({"error": "Key not found"}, status_code=404)
     
     key.is_active = False
     db.commit()
     
-    return JSONResponse({"message": "Key deleted"})
+    return ORJSONResponse({"message": "Key deleted"})
 
 
 # =============================================================================
@@ -276,38 +316,168 @@ async def delete_api_key(
 
 @router.get("/pricing", response_class=HTMLResponse)
 async def pricing_page(request: Request):
-    from fastapi.templating import Jinja2Templates
-    templates = Jinja2Templates(directory="templates")
     return templates.TemplateResponse("pricing.html", {"request": request})
 
 
+@router.get("/api/pricing")
+async def pricing_tiers():
+    return Response(PRICING_TIERS_JSON, media_type="application/json")
+
+
 # =============================================================================
 # HELPER: Validate API key for API calls
 # =============================================================================
 
-def validate_api_key(api_key: str, db: Session) -> Optional[User]:
+def _bump_api_key_usage(key_id: int, db: Session):
+    """Bump an API key's usage stats in a single UPDATE (uncommitted)"""
+    db.query(APIKey).filter(APIKey.id == key_id).update({
+        APIKey.last_used: datetime.utcnow(),
+        APIKey.usage_count: APIKey.usage_count + 1
+    }, synchronize_session=False)
+
+
+def record_api_key_usage(key_id: int):
+    """Bump an API key's usage stats (meant to run after the response is sent)"""
+    db = SessionLocal()
+    try:
+        _bump_api_key_usage(key_id, db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def queue_api_key_usage(key_id: int) -> bool:
+    """Count an API key use in Redis; flush_api_key_usage() moves it to the DB later.
+    Returns False if Redis is unavailable so the caller can write to the DB instead."""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hincrby(f"apikey:{key_id}", "n", 1)
+        pipe.hset(f"apikey:{key_id}", "ts", int(time.time()))
+        pipe.sadd(API_KEY_TOUCHED_SET, key_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Redis unavailable, recording API key usage directly: {e}")
+        return False
+    return True
+
+
+def _requeue_api_key_usage(counts: dict, last_seen: dict):
+    """Put drained counters back into Redis so the next flush retries them"""
+    pipe = redis_client.pipeline()
+    for key_id, count in counts.items():
+        pipe.hincrby(f"apikey:{key_id}", "n", count)
+        # Keep a newer timestamp if the key was used again since the drain
+        pipe.hsetnx(f"apikey:{key_id}", "ts", last_seen[key_id])
+        pipe.sadd(API_KEY_TOUCHED_SET, key_id)
+    pipe.execute()
+
+
+def flush_api_key_usage():
+    """Write the usage counted in Redis to api_keys with a single UPDATE"""
+    counts, last_seen = {}, {}
+    try:
+        while True:
+            key_ids = redis_client.spop(API_KEY_TOUCHED_SET, 1000)
+            if not key_ids:
+                break
+            for raw_id in key_ids:
+                key_id = int(raw_id)
+                # Read and clear atomically so no increment is lost in between
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.hgetall(f"apikey:{key_id}")
+                pipe.delete(f"apikey:{key_id}")
+                stats, _ = pipe.execute()
+                if stats:
+                    counts[key_id] = counts.get(key_id, 0) + int(stats[b"n"])
+                    last_seen[key_id] = int(stats[b"ts"])
+    except redis.RedisError as e:
+        # Still write out whatever was already drained
+        logger.error(f"Redis error while draining API key usage: {e}")
+    if not counts:
+        return
+    last_used = {key_id: datetime.utcfromtimestamp(ts) for key_id, ts in last_seen.items()}
+    
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(APIKey)
+            .where(APIKey.id.in_(counts))
+            .values(
+                usage_count=APIKey.usage_count + case(counts, value=APIKey.id, else_=0),
+                last_used=case(last_used, value=APIKey.id, else_=APIKey.last_used)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        try:
+            _requeue_api_key_usage(counts, last_seen)
+        except redis.RedisError as redis_error:
+            # DB and Redis both down - these counts can't be kept anywhere
+            logger.error(
+                f"API key usage lost, DB update failed ({e}) and Redis requeue failed "
+                f"({redis_error}); dropped counts: {counts}"
+            )
+        raise
+    finally:
+        db.close()
+
+
+async def _flush_api_key_usage_periodically():
+    while True:
+        await asyncio.sleep(API_KEY_USAGE_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(flush_api_key_usage)
+        except Exception as e:
+            logger.error(f"API key usage flush failed: {e}")
+
+
+def validate_api_key(
+    api_key: str,
+    db: Session,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> Optional[User]:
     """Validate API key and return user if valid"""
     if not api_key or not api_key.startswith("bslt_"):
         return None
     
-    key = db.query(APIKey).filter(APIKey.key == api_key, APIKey.is_active == True).first()
+    key = db.query(APIKey).filter(APIKey.key_hash == hash_api_key(api_key), APIKey.is_active == True).first()
     if not key:
         return None
     
-    # Update usage
-    key.last_used = datetime.utcnow()
-    key.usage_count += 1
-    db.commit()
+    # Update usage - off the request path (Redis counter, or after the response)
+    queued = redis_client is not None and queue_api_key_usage(key.id)
+    if not queued:
+        if background_tasks is not None:
+            background_tasks.add_task(record_api_key_usage, key.id)
+        else:
+            # No BackgroundTasks - write through the caller's session
+            _bump_api_key_usage(key.id, db)
+            db.commit()
     
     return db.query(User).filter(User.id == key.user_id).first()
 
 
+def _reset_quota_if_due(user: User, db: Session) -> bool:
+    """Zero the monthly count once the reset date has passed (uncommitted).
+    Returns True if a reset was written."""
+    now = datetime.utcnow()
+    if not (user.reset_date and now > user.reset_date):
+        return False
+    # The WHERE repeats the check so concurrent requests only reset once
+    result = db.execute(
+        update(User)
+        .where(User.id == user.id, User.reset_date < now)
+        .values(notarizations_this_month=0, reset_date=now + timedelta(days=30))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
 def check_user_limit(user: User, db: Session) -> bool:
     """Check if user can notarize (has remaining quota)"""
-    # Reset if needed
-    if user.reset_date and datetime.utcnow() > user.reset_date:
-        user.notarizations_this_month = 0
-        user.reset_date = datetime.utcnow() + timedelta(days=30)
+    if _reset_quota_if_due(user, db):
         db.commit()
     
     return user.notarizations_this_month < user.monthly_limit
@@ -315,5 +485,24 @@ def check_user_limit(user: User, db: Session) -> bool:
 
 def increment_user_usage(user: User, db: Session):
     """Increment user's usage count"""
-    user.notarizations_this_month += 1
+    db.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(notarizations_this_month=User.notarizations_this_month + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def consume_user_quota(user: User, db: Session) -> bool:
+    """Atomically check and take one notarization from the user's quota.
+    Returns False (and takes nothing) when the quota is used up."""
+    _reset_quota_if_due(user, db)
+    result = db.execute(
+        update(User)
+        .where(User.id == user.id, User.notarizations_this_month < User.monthly_limit)
+        .values(notarizations_this_month=User.notarizations_this_month + 1)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
+    return result.rowcount == 1